@@ -6,17 +6,17 @@ echo    DASHBOARD FINANCEIRO - FLUXO DE CAIXA
 echo ====================================
 echo.
 echo Verificando e instalando dependencias...
-python -c "import streamlit, pandas, plotly, numpy, fpdf" 2>nul
+rem requirements.txt fixa as versoes minimas: o pip so instala ou atualiza o que faltar
+pip install -q -r requirements.txt
 
 if errorlevel 1 (
     echo.
-    echo Instalando bibliotecas necessarias...
-    pip install streamlit pandas plotly numpy fpdf2
-    echo.
-    echo Instalacao concluida!
+    echo Falha ao instalar as bibliotecas necessarias!
+    pause
+    exit /b 1
 ) else (
     echo.
-    echo Todas as bibliotecas ja estao instaladas!
+    echo Todas as bibliotecas estao instaladas e atualizadas!
 )
 
 echo.
@@ -1,16 +1,13 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime
 import numpy as np
 from fpdf import FPDF
-import base64
-import tempfile
-import os
 import io
+import hashlib
 from PIL import Image
-import subprocess
-import sys
 
 # Configuração da página
 st.set_page_config(
@@ -69,31 +66,52 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Verificar e instalar kaleido silenciosamente
-def verificar_e_instalar_kaleido():
-    try:
-        import kaleido
-        return True
-    except ImportError:
-        try:
-            # Instalação silenciosa do kaleido
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "kaleido", "--quiet"], 
-                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            # Verificar se a instalação foi bem-sucedida
-            import kaleido
-            return True
-        except:
-            return False
-
-# Verificar/instalar kaleido automaticamente (sem mostrar mensagens para o usuário)
-KALEIDO_DISPONIVEL = verificar_e_instalar_kaleido()
+# Dias da semana em português, na ordem de Series.dt.dayofweek (0 = segunda-feira)
+DIAS_SEMANA = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
+
+# Configuração comum dos gráficos na tela: sem barra de ferramentas nem animações,
+# com o mesmo layout base (objetos estáveis permitem ao frontend pular atualizações)
+PLOTLY_CFG = {'displayModeBar': False, 'responsive': True}
+COMMON_LAYOUT = dict(height=400, margin=dict(l=40, r=20, t=60, b=40), transition_duration=0)
+CORES_TIPO = {'Receita': '#2ecc71', 'Despesa': '#e74c3c'}
+
+# Cabeçalhos das seções, montados uma única vez
+SECTION_HEADERS = {
+    'kpis': '<div class="section-header">📈 KPIs FINANCEIROS PRINCIPAIS</div>',
+    'avancados': '<div class="section-header">🎯 KPIs FINANCEIROS AVANÇADOS</div>',
+    'alertas': '<div class="section-header">⚠️ ALERTAS E RECOMENDAÇÕES</div>',
+    'gargalos': '<div class="section-header">🔍 ANÁLISE DE GARGALOS</div>',
+    'evolucao': '<div class="section-header">📈 EVOLUÇÃO TEMPORAL</div>',
+    'sazonalidade': '<div class="section-header">📅 ANÁLISE DE SAZONALIDADE</div>',
+    'subcategorias': '<div class="section-header">📊 DISTRIBUIÇÃO POR SUBCATEGORIA</div>',
+    'exportar': '<div class="section-header">💾 EXPORTAR RELATÓRIO</div>'
+}
+
+# Cartões dos KPIs avançados, preenchidos com format_map(kpis_avancados)
+KPI_CARDS_AVANCADOS = (
+    '<div class="advanced-kpi"><h3>📈 ROI</h3><h2>{roi:.1f}%</h2><small>Return on Investment</small></div>',
+    '<div class="advanced-kpi"><h3>⚖️ PONTO DE EQUILÍBRIO</h3><h2>R$ {ponto_equilibrio:,.2f}</h2><small>Break-even Point</small></div>',
+    '<div class="advanced-kpi"><h3>💼 FLUXO DE CAIXA</h3><h2>R$ {fluxo_caixa_operacional:,.2f}</h2><small>Operational Cash Flow</small></div>',
+    '<div class="advanced-kpi"><h3>🔄 CICLO DE CAIXA</h3><h2>{ciclo_conversao_caixa} dias</h2><small>Cash Conversion Cycle</small></div>'
+)
+KPI_CARD_MARGEM = '<div class="advanced-kpi"><h3>📊 MARGEM DE CONTRIBUIÇÃO</h3><h2>{margem_contribuicao:.1f}%</h2><small>Contribuição Marginal</small></div>'
+
+# Kaleido (exportação dos gráficos para o PDF) é instalado via requirements.txt
+try:
+    import kaleido
+    KALEIDO_DISPONIVEL = True
+except ImportError:
+    KALEIDO_DISPONIVEL = False
 
 class PDFReport(FPDF):
+    # Momento da geração exibido no cabeçalho (o mesmo do nome do arquivo)
+    gerado_em = None
+    
     def header(self):
         self.set_font('Arial', 'B', 16)
         self.cell(0, 10, 'RELATORIO FINANCEIRO - DASHBOARD', 0, 1, 'C')
         self.set_font('Arial', 'I', 12)
-        self.cell(0, 10, f'Gerado em: {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 1, 'C')
+        self.cell(0, 10, f'Gerado em: {(self.gerado_em or datetime.now()).strftime("%d/%m/%Y %H:%M")}', 0, 1, 'C')
         self.ln(10)
     
     def chapter_title(self, title):
@@ -112,6 +130,14 @@ class PDFReport(FPDF):
         self.cell(0, 10, company_name, 0, 1, 'C')
         self.ln(5)
 
+def _formatar_meses(meses):
+    """Converte chaves de mês AAAAMM em rótulos 'AAAA-MM' para exibição"""
+    return [f"{mes // 100}-{mes % 100:02d}" for mes in meses]
+
+def _opcoes_filtro(serie):
+    """Lista os valores presentes de uma coluna categórica na ordem em que aparecem (sem vazios)"""
+    return serie.dropna().unique().tolist()
+
 def validar_estrutura_dados(df):
     """Valida se o DataFrame tem a estrutura esperada"""
     colunas_obrigatorias = ['Data', 'Categoria', 'Subcategoria', 'Tipo', 'Valor']
@@ -120,75 +146,85 @@ def validar_estrutura_dados(df):
     if colunas_faltantes:
         raise ValueError(f"Colunas obrigatórias faltantes: {colunas_faltantes}")
     
-    # Validar tipos de dados
-    if 'Valor' in df.columns:
-        if df['Valor'].dtype not in ['float64', 'int64']:
-            try:
-                df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
-            except:
-                raise ValueError("Coluna 'Valor' deve conter números")
+    # Converter Valor para número (células não numéricas viram NaN em vez de
+    # impedir o carregamento do arquivo inteiro)
+    df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
     
-    # Validar valores negativos
-    if (df['Valor'] < 0).any():
+    # Validar valores negativos (fmin.reduce ignora NaN e não aloca máscara booleana)
+    valores = df['Valor'].to_numpy()
+    if valores.size and np.fmin.reduce(valores) < 0:
         st.warning("⚠️ Foram encontrados valores negativos na coluna 'Valor'. Certifique-se de que os dados estão consistentes.")
     
     return True
 
-@st.cache_data
-def carregar_dados(uploaded_file):
-    """Carrega e prepara os dados do CSV com cache"""
-    df = pd.read_csv(uploaded_file)
+@st.cache_data(max_entries=4)
+def carregar_dados(_conteudo, chave_dados):
+    """Carrega e prepara os dados do CSV com cache em memória pelo hash do arquivo"""
+    # Colunas de baixa cardinalidade como categorias direto no parser (comparações
+    # e groupby sobre códigos inteiros); Valor é convertido na validação, com tolerância a erros
+    colunas_utilizadas = {'Data', 'Categoria', 'Subcategoria', 'Tipo', 'Cliente', 'Valor'}
+    df = pd.read_csv(
+        io.BytesIO(_conteudo),
+        usecols=lambda coluna: coluna in colunas_utilizadas,
+        dtype={'Categoria': 'category', 'Subcategoria': 'category', 'Tipo': 'category'}
+    )
     
     # Validar estrutura dos dados
     validar_estrutura_dados(df)
     
-    # Converter coluna Data
+    # Converter coluna Data (errors='coerce' descarta datas inválidas; parse_dates
+    # no read_csv deixaria a coluna inteira como texto nesse caso)
     if 'Data' in df.columns:
         df['Data'] = pd.to_datetime(df['Data'], errors='coerce')
         df = df.dropna(subset=['Data'])
     
-    # Criar colunas auxiliares
-    df['Mês'] = df['Data'].dt.to_period('M').astype(str)
-    df['Ano'] = df['Data'].dt.year
-    
-    # Traduzir dias da semana para português
-    dias_traduzidos = {
-        'Monday': 'Segunda-feira',
-        'Tuesday': 'Terça-feira', 
-        'Wednesday': 'Quarta-feira',
-        'Thursday': 'Quinta-feira',
-        'Friday': 'Sexta-feira',
-        'Saturday': 'Sábado',
-        'Sunday': 'Domingo'
-    }
-    df['Dia da Semana'] = df['Data'].dt.day_name().map(dias_traduzidos)
+    # Criar colunas auxiliares (Mês como chave inteira AAAAMM)
+    df['Mês'] = (df['Data'].dt.year * 100 + df['Data'].dt.month).astype('int32')
+    
+    # Dias da semana em português direto dos códigos (0 = segunda-feira), já na ordem de exibição
+    df['Dia da Semana'] = pd.Categorical.from_codes(df['Data'].dt.dayofweek.to_numpy().astype('int8'), categories=DIAS_SEMANA, ordered=True)
     
     return df
 
+def _valores_por_subcategoria(valores_por_tipo, tipo):
+    """Extrai do agregado Tipo/Subcategoria a série 'Valor' de um tipo, indexada por 'Subcategoria'"""
+    if tipo not in valores_por_tipo.index.get_level_values('Tipo'):
+        return pd.Series(dtype='float64', name='Valor', index=pd.Index([], name='Subcategoria'))
+    
+    valores = valores_por_tipo.loc[tipo]
+    return valores[valores.index.notna()]
+
 @st.cache_data
 def calcular_kpis_basicos(df):
     """Calcula todos os KPIs financeiros básicos com cache"""
     if df.empty:
         return {}
     
+    # Agregação única por Tipo/Subcategoria: soma e contagem na mesma passada
+    # (dropna=False mantém nos totais as transações sem subcategoria)
+    resumo = df.groupby(['Tipo', 'Subcategoria'], sort=False, observed=True, dropna=False)['Valor'].agg(['sum', 'size'])
+    valores_por_tipo = resumo['sum'].rename('Valor')
+    totais_por_tipo = resumo.groupby(level='Tipo', observed=True).sum()
+    
     # KPIs básicos
-    total_receitas = df[df['Tipo'] == 'Receita']['Valor'].sum()
-    total_despesas = df[df['Tipo'] == 'Despesa']['Valor'].sum()
+    total_receitas = totais_por_tipo['sum'].get('Receita', 0)
+    total_despesas = totais_por_tipo['sum'].get('Despesa', 0)
     saldo_liquido = total_receitas - total_despesas
     margem_liquida = (saldo_liquido / total_receitas * 100) if total_receitas > 0 else 0
     
     # KPIs avançados
     num_transacoes = len(df)
-    num_receitas = len(df[df['Tipo'] == 'Receita'])
+    num_receitas = totais_por_tipo['size'].get('Receita', 0)
     ticket_medio = total_receitas / num_receitas if num_receitas > 0 else 0
     
-    # Análise de subcategorias
-    top_subcategorias_receita = df[df['Tipo'] == 'Receita'].groupby('Subcategoria')['Valor'].sum().nlargest(10)
-    top_subcategorias_despesa = df[df['Tipo'] == 'Despesa'].groupby('Subcategoria')['Valor'].sum().nlargest(10)
-    
     # Análise de todas as subcategorias para os gráficos de pizza
-    receitas_por_subcategoria = df[df['Tipo'] == 'Receita'].groupby('Subcategoria')['Valor'].sum()
-    despesas_por_subcategoria = df[df['Tipo'] == 'Despesa'].groupby('Subcategoria')['Valor'].sum()
+    receitas_por_subcategoria = _valores_por_subcategoria(valores_por_tipo, 'Receita')
+    despesas_por_subcategoria = _valores_por_subcategoria(valores_por_tipo, 'Despesa')
+    
+    # Análise de subcategorias: top 10 ordenado uma única vez, usado nos gráficos
+    # de gargalos, de pizza e do PDF
+    top_subcategorias_receita = receitas_por_subcategoria.nlargest(10)
+    top_subcategorias_despesa = despesas_por_subcategoria.nlargest(10)
     
     return {
         'total_receitas': total_receitas,
@@ -203,6 +239,7 @@ def calcular_kpis_basicos(df):
         'despesas_por_subcategoria': despesas_por_subcategoria
     }
 
+@st.cache_data(show_spinner=False)
 def calcular_kpis_avancados_melhorado(df, kpis_basicos):
     """Calcula KPIs financeiros avançados com dados mais realistas"""
     total_receitas = kpis_basicos['total_receitas']
@@ -222,9 +259,11 @@ def calcular_kpis_avancados_melhorado(df, kpis_basicos):
     ponto_equilibrio = custos_fixos / margem_contribuicao if margem_contribuicao > 0 else 0
     
     # Ciclo de Conversão de Caixa baseado em análise real dos dados
-    if 'Data' in df.columns:
-        # Calcular prazos médios baseados nas datas
-        dias_entre_transacoes = df.sort_values('Data')['Data'].diff().dt.days.mean()
+    if 'Data' in df.columns and len(df) > 1:
+        # Calcular prazos médios baseados nas datas: a média das diferenças entre
+        # datas consecutivas é (última - primeira) / (N - 1), sem ordenar o DataFrame
+        # (dividir por um Timedelta independe da resolução de armazenamento da coluna)
+        dias_entre_transacoes = (df['Data'].max() - df['Data'].min()) / pd.Timedelta(days=1) / (len(df) - 1)
         ciclo_conversao_caixa = min(max(int(dias_entre_transacoes or 45), 30), 90)
     else:
         ciclo_conversao_caixa = 45  # Valor padrão
@@ -237,16 +276,14 @@ def calcular_kpis_avancados_melhorado(df, kpis_basicos):
         'margem_contribuicao': margem_contribuicao * 100
     }
 
+@st.cache_data(show_spinner=False)
 def analisar_tendencias(df):
     """Analisa tendências nos dados financeiros"""
     if len(df) < 2:
         return {}
     
     # Agrupar por mês para análise de tendência
-    df_mensal = df.groupby(['Ano', 'Mês']).agg({
-        'Valor': 'sum',
-        'Tipo': lambda x: (x == 'Receita').sum()
-    }).reset_index()
+    df_mensal = df.groupby('Mês', sort=True)['Valor'].sum().reset_index()
     
     # Calcular crescimento mensal
     if len(df_mensal) > 1:
@@ -259,7 +296,7 @@ def analisar_tendencias(df):
     
     # Análise de sazonalidade por dia da semana
     if 'Dia da Semana' in df.columns:
-        sazonalidade = df.groupby('Dia da Semana')['Valor'].mean()
+        sazonalidade = df.groupby('Dia da Semana', observed=True)['Valor'].mean()
         dia_maior_movimento = sazonalidade.idxmax() if not sazonalidade.empty else "N/A"
     else:
         dia_maior_movimento = "N/A"
@@ -272,68 +309,54 @@ def analisar_tendencias(df):
         'num_meses_analisados': len(df_mensal)
     }
 
-def gerar_alertas(kpis_basicos, kpis_avancados, tendencias):
-    """Gera alertas baseados nos KPIs"""
-    alertas = []
-    
+# Regras de alerta: (condição, tipo, mensagem, mensagem sem emoji para o PDF)
+_REGRAS_ALERTAS = (
     # Alertas críticos
-    if kpis_basicos['saldo_liquido'] < 0:
-        alertas.append({
-            "tipo": "critical",
-            "mensagem": "❌ **ALERTA CRÍTICO**: Saldo líquido negativo! Reveja urgentemente suas despesas.",
-            "mensagem_sem_emoji": "ALERTA CRÍTICO: Saldo líquido negativo! Reveja urgentemente suas despesas."
-        })
-    
-    if kpis_basicos['margem_liquida'] < 5:
-        alertas.append({
-            "tipo": "critical", 
-            "mensagem": "⚠️ **ALERTA**: Margem líquida abaixo de 5% - Risco financeiro alto",
-            "mensagem_sem_emoji": "ALERTA: Margem líquida abaixo de 5% - Risco financeiro alto"
-        })
+    (lambda k, a, t: k['saldo_liquido'] < 0, "critical",
+     "❌ **ALERTA CRÍTICO**: Saldo líquido negativo! Reveja urgentemente suas despesas.",
+     "ALERTA CRÍTICO: Saldo líquido negativo! Reveja urgentemente suas despesas."),
+    (lambda k, a, t: k['margem_liquida'] < 5, "critical",
+     "⚠️ **ALERTA**: Margem líquida abaixo de 5% - Risco financeiro alto",
+     "ALERTA: Margem líquida abaixo de 5% - Risco financeiro alto"),
     
     # Alertas de atenção
-    if kpis_basicos['margem_liquida'] < 10:
-        alertas.append({
-            "tipo": "warning",
-            "mensagem": "📉 **ATENÇÃO**: Margem líquida abaixo de 10% - Considere otimizar custos",
-            "mensagem_sem_emoji": "ATENCAO: Margem líquida abaixo de 10% - Considere otimizar custos"
-        })
-    
-    if kpis_avancados['roi'] < 15:
-        alertas.append({
-            "tipo": "warning",
-            "mensagem": "📊 **OPORTUNIDADE**: ROI abaixo de 15% - Avalie novos investimentos",
-            "mensagem_sem_emoji": "OPORTUNIDADE: ROI abaixo de 15% - Avalie novos investimentos"
-        })
-    
-    if kpis_avancados['ciclo_conversao_caixa'] > 60:
-        alertas.append({
-            "tipo": "warning",
-            "mensagem": "⏳ **ALERTA**: Ciclo de conversão de caixa muito longo (>60 dias)",
-            "mensagem_sem_emoji": "ALERTA: Ciclo de conversão de caixa muito longo (>60 dias)"
-        })
+    (lambda k, a, t: k['margem_liquida'] < 10, "warning",
+     "📉 **ATENÇÃO**: Margem líquida abaixo de 10% - Considere otimizar custos",
+     "ATENCAO: Margem líquida abaixo de 10% - Considere otimizar custos"),
+    (lambda k, a, t: a['roi'] < 15, "warning",
+     "📊 **OPORTUNIDADE**: ROI abaixo de 15% - Avalie novos investimentos",
+     "OPORTUNIDADE: ROI abaixo de 15% - Avalie novos investimentos"),
+    (lambda k, a, t: a['ciclo_conversao_caixa'] > 60, "warning",
+     "⏳ **ALERTA**: Ciclo de conversão de caixa muito longo (>60 dias)",
+     "ALERTA: Ciclo de conversão de caixa muito longo (>60 dias)"),
     
     # Alertas positivos
-    if kpis_basicos['margem_liquida'] > 20:
-        alertas.append({
-            "tipo": "success",
-            "mensagem": "🎉 **EXCELENTE**: Margem líquida acima de 20% - Performance destacada!",
-            "mensagem_sem_emoji": "EXCELENTE: Margem líquida acima de 20% - Performance destacada!"
-        })
-    
-    if kpis_avancados['roi'] > 25:
-        alertas.append({
-            "tipo": "success", 
-            "mensagem": "🚀 **DESTAQUE**: ROI acima de 25% - Retorno excepcional!",
-            "mensagem_sem_emoji": "DESTAQUE: ROI acima de 25% - Retorno excepcional!"
-        })
-    
-    if tendencias.get('tendencia_positiva', False):
-        alertas.append({
-            "tipo": "success",
-            "mensagem": "📈 **CRESCIMENTO**: Tendência positiva identificada nos últimos períodos",
-            "mensagem_sem_emoji": "CRESCIMENTO: Tendência positiva identificada nos últimos períodos"
-        })
+    (lambda k, a, t: k['margem_liquida'] > 20, "success",
+     "🎉 **EXCELENTE**: Margem líquida acima de 20% - Performance destacada!",
+     "EXCELENTE: Margem líquida acima de 20% - Performance destacada!"),
+    (lambda k, a, t: a['roi'] > 25, "success",
+     "🚀 **DESTAQUE**: ROI acima de 25% - Retorno excepcional!",
+     "DESTAQUE: ROI acima de 25% - Retorno excepcional!"),
+    (lambda k, a, t: t.get('tendencia_positiva', False), "success",
+     "📈 **CRESCIMENTO**: Tendência positiva identificada nos últimos períodos",
+     "CRESCIMENTO: Tendência positiva identificada nos últimos períodos"),
+)
+
+# Bloco HTML de cada tipo de alerta
+_ALERT_TMPL = {
+    "critical": '<div class="alert-critical">{}</div>',
+    "warning": '<div class="alert-warning">{}</div>',
+    "success": '<div class="alert-success">{}</div>'
+}
+
+@st.cache_data(show_spinner=False)
+def gerar_alertas(kpis_basicos, kpis_avancados, tendencias):
+    """Gera alertas baseados nos KPIs"""
+    alertas = [
+        {"tipo": tipo, "mensagem": mensagem, "mensagem_sem_emoji": mensagem_sem_emoji}
+        for condicao, tipo, mensagem, mensagem_sem_emoji in _REGRAS_ALERTAS
+        if condicao(kpis_basicos, kpis_avancados, tendencias)
+    ]
     
     return alertas if alertas else [{
         "tipo": "success",
@@ -341,161 +364,197 @@ def gerar_alertas(kpis_basicos, kpis_avancados, tendencias):
         "mensagem_sem_emoji": "TUDO OK: Todos os indicadores dentro das metas esperadas"
     }]
 
-def criar_grafico_topo_subcategorias(kpis_basicos, temp_dir):
-    """Cria gráficos de top subcategorias e retorna os caminhos das imagens"""
+@st.cache_data(show_spinner=False)
+def calcular_indicadores(_df, chave_dados, chave_filtros):
+    """Calcula KPIs, tendências e alertas com cache por arquivo e estado dos filtros"""
+    # _df fica fora do hash: o recorte é identificado pelo conteúdo do arquivo e
+    # pelas seleções dos filtros, então voltar a uma combinação já vista é imediato
+    kpis_basicos = calcular_kpis_basicos(_df)
+    kpis_avancados = calcular_kpis_avancados_melhorado(_df, kpis_basicos)
+    tendencias = analisar_tendencias(_df)
+    alertas = gerar_alertas(kpis_basicos, kpis_avancados, tendencias)
+    
+    return kpis_basicos, kpis_avancados, tendencias, alertas
+
+@st.cache_data(show_spinner=False)
+def calcular_agregacoes_temporais(_df, chave_dados, chave_filtros):
+    """Agrega os valores por mês, tipo e dia da semana numa única passada (cache por arquivo e filtros)"""
+    valores = _df.groupby(['Mês', 'Tipo', 'Dia da Semana'], observed=True, dropna=False)['Valor'].sum()
+    
+    # Fatias derivadas do agregado (pequeno), sem voltar ao DataFrame
+    mes_tipo = valores.groupby(level=['Mês', 'Tipo'], observed=True).sum()
+    tipos_presentes = mes_tipo.index.get_level_values('Tipo')
+    receitas_mensais = mes_tipo.xs('Receita', level='Tipo') if 'Receita' in tipos_presentes else mes_tipo.iloc[:0].droplevel('Tipo')
+    despesas_mensais = mes_tipo.xs('Despesa', level='Tipo') if 'Despesa' in tipos_presentes else mes_tipo.iloc[:0].droplevel('Tipo')
+    # observed=False devolve os 7 dias na ordem da categoria, com zero nos dias sem movimento
+    movimento_diario = valores.groupby(level='Dia da Semana', observed=False).sum()
+    
+    # Mês x Tipo já pivotado (uma coluna por tipo presente, Receita e Despesa primeiro,
+    # zero onde não há movimento); meses sem nenhum valor não vão para o gráfico
+    tipos = tipos_presentes.dropna().unique().tolist()
+    colunas = [tipo for tipo in ('Receita', 'Despesa') if tipo in tipos] + [tipo for tipo in tipos if tipo not in ('Receita', 'Despesa')]
+    evolucao_mensal = mes_tipo.round(2).unstack('Tipo', fill_value=0).reindex(columns=colunas, fill_value=0)
+    evolucao_mensal = evolucao_mensal[evolucao_mensal.any(axis=1)]
+    
+    # Rótulos de mês formatados só sobre os agregados
+    evolucao_mensal.index = pd.Index(_formatar_meses(evolucao_mensal.index), name='Mês')
+    receitas_mensais.index = pd.Index(_formatar_meses(receitas_mensais.index), name='Mês')
+    despesas_mensais.index = pd.Index(_formatar_meses(despesas_mensais.index), name='Mês')
+    
+    return {
+        'evolucao_mensal': evolucao_mensal,
+        'receitas_mensais': receitas_mensais,
+        'despesas_mensais': despesas_mensais,
+        'movimento_diario': movimento_diario
+    }
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _renderizar_graficos_pdf(top_receitas, top_despesas):
+    """Renderiza em lote os gráficos do PDF e retorna os PNGs em bytes (cache por conteúdo das séries)"""
     imagens = {}
     
-    try:
-        # Gráfico de top receitas - otimizado para PDF
-        if not kpis_basicos['top_subcategorias_receita'].empty:
-            # Limitar para 5 categorias para melhor visualização
-            top_receitas_data = kpis_basicos['top_subcategorias_receita'].nlargest(5).reset_index()
-            
-            fig_receitas = px.bar(
-                top_receitas_data,
-                x='Valor',
-                y='Subcategoria',
-                orientation='h',
-                color='Valor',
-                color_continuous_scale='Viridis',
-                title='Top 5 - Principais Fontes de Receita'
-            )
-            
-            # Configurações otimizadas para PDF
-            fig_receitas.update_layout(
-                height=350,  # Altura aumentada para caber legendas
-                width=600,   # Largura fixa
-                showlegend=False,
-                margin=dict(l=120, r=20, t=50, b=50),  # Margem esquerda maior para labels
-                font=dict(size=10)  # Fonte menor
-            )
-            fig_receitas.update_xaxes(title_text="Valor (R$)", title_font=dict(size=10))
-            fig_receitas.update_yaxes(title_text="", tickfont=dict(size=9))
-            
-            # Salvar como imagem
-            img_path_receitas = os.path.join(temp_dir, "top_receitas.png")
-            fig_receitas.write_image(img_path_receitas, width=600, height=350, scale=1)
-            imagens['top_receitas'] = img_path_receitas
+    # Gráfico de top receitas - otimizado para PDF
+    if not top_receitas.empty:
+        valores = top_receitas.to_numpy()
         
-        # Gráfico de top despesas - otimizado para PDF
-        if not kpis_basicos['top_subcategorias_despesa'].empty:
-            # Limitar para 5 categorias para melhor visualização
-            top_despesas_data = kpis_basicos['top_subcategorias_despesa'].nlargest(5).reset_index()
-            
-            fig_despesas = px.bar(
-                top_despesas_data,
-                x='Valor',
-                y='Subcategoria',
-                orientation='h',
-                color='Valor',
-                color_continuous_scale='Reds',
-                title='Top 5 - Maiores Gastos'
-            )
-            
-            # Configurações otimizadas para PDF
-            fig_despesas.update_layout(
-                height=350,  # Altura aumentada para caber legendas
-                width=600,   # Largura fixa
-                showlegend=False,
-                margin=dict(l=120, r=20, t=50, b=50),  # Margem esquerda maior para labels
-                font=dict(size=10)  # Fonte menor
-            )
-            fig_despesas.update_xaxes(title_text="Valor (R$)", title_font=dict(size=10))
-            fig_despesas.update_yaxes(title_text="", tickfont=dict(size=9))
-            
-            # Salvar como imagem
-            img_path_despesas = os.path.join(temp_dir, "top_despesas.png")
-            fig_despesas.write_image(img_path_despesas, width=600, height=350, scale=1)
-            imagens['top_despesas'] = img_path_despesas
+        fig_receitas = go.Figure(go.Bar(
+            x=valores,
+            y=top_receitas.index.to_numpy(),
+            orientation='h',
+            marker=dict(color=valores, colorscale='Viridis', showscale=True, colorbar=dict(title='Valor'))
+        ))
         
-        # Gráfico de distribuição por subcategoria - CORRIGIDO para cores
-        if not kpis_basicos['receitas_por_subcategoria'].empty:
-            top_receitas = kpis_basicos['receitas_por_subcategoria'].nlargest(5)
-            fig_pie_receitas = px.pie(
-                top_receitas.reset_index(),
-                values='Valor',
-                names='Subcategoria',
-                title='Distribuição de Receitas (Top 5)',
-                color_discrete_sequence=px.colors.qualitative.Set3  # Paleta de cores específica
-            )
-            
-            # Configurações otimizadas para PDF
-            fig_pie_receitas.update_layout(
-                height=400,
-                width=500,
-                margin=dict(l=20, r=20, t=50, b=20),
-                font=dict(size=10),
-                showlegend=True,
-                legend=dict(
-                    font=dict(size=9),
-                    orientation="v",
-                    yanchor="middle",
-                    y=0.5,
-                    xanchor="right",
-                    x=1.3
-                )
-            )
-            
-            # Atualizar o traço (bordas) das fatias
-            fig_pie_receitas.update_traces(
-                textposition='inside',
-                textinfo='percent+label',
-                insidetextorientation='radial',
-                marker=dict(line=dict(color='white', width=1))
+        # Configurações otimizadas para PDF
+        fig_receitas.update_layout(dict(
+            title='Top 5 - Principais Fontes de Receita',
+            height=350,  # Altura aumentada para caber legendas
+            width=600,   # Largura fixa
+            showlegend=False,
+            margin=dict(l=120, r=20, t=50, b=50),  # Margem esquerda maior para labels
+            font=dict(size=10),  # Fonte menor
+            xaxis=dict(title=dict(text="Valor (R$)", font=dict(size=10))),
+            yaxis=dict(title=dict(text=""), tickfont=dict(size=9))
+        ))
+        
+        # Renderizar como imagem
+        imagens['top_receitas'] = fig_receitas.to_image(format='png', width=600, height=350, scale=1)
+    
+    # Gráfico de top despesas - otimizado para PDF
+    if not top_despesas.empty:
+        valores = top_despesas.to_numpy()
+        
+        fig_despesas = go.Figure(go.Bar(
+            x=valores,
+            y=top_despesas.index.to_numpy(),
+            orientation='h',
+            marker=dict(color=valores, colorscale='Reds', showscale=True, colorbar=dict(title='Valor'))
+        ))
+        
+        # Configurações otimizadas para PDF
+        fig_despesas.update_layout(dict(
+            title='Top 5 - Maiores Gastos',
+            height=350,  # Altura aumentada para caber legendas
+            width=600,   # Largura fixa
+            showlegend=False,
+            margin=dict(l=120, r=20, t=50, b=50),  # Margem esquerda maior para labels
+            font=dict(size=10),  # Fonte menor
+            xaxis=dict(title=dict(text="Valor (R$)", font=dict(size=10))),
+            yaxis=dict(title=dict(text=""), tickfont=dict(size=9))
+        ))
+        
+        # Renderizar como imagem
+        imagens['top_despesas'] = fig_despesas.to_image(format='png', width=600, height=350, scale=1)
+    
+    # Gráfico de distribuição por subcategoria - CORRIGIDO para cores
+    if not top_receitas.empty:
+        fig_pie_receitas = go.Figure(go.Pie(
+            labels=top_receitas.index.to_numpy(),
+            values=top_receitas.to_numpy(),
+            textposition='inside',
+            textinfo='percent+label',
+            insidetextorientation='radial',
+            marker=dict(
+                colors=px.colors.qualitative.Set3,  # Paleta de cores específica
+                line=dict(color='white', width=1)
             )
-            
-            img_path_pie_receitas = os.path.join(temp_dir, "pie_receitas.png")
-            fig_pie_receitas.write_image(img_path_pie_receitas, width=500, height=400, scale=1)
-            imagens['pie_receitas'] = img_path_pie_receitas
+        ))
         
-        if not kpis_basicos['despesas_por_subcategoria'].empty:
-            top_despesas = kpis_basicos['despesas_por_subcategoria'].nlargest(5)
-            fig_pie_despesas = px.pie(
-                top_despesas.reset_index(),
-                values='Valor',
-                names='Subcategoria',
-                title='Distribuição de Despesas (Top 5)',
-                color_discrete_sequence=px.colors.qualitative.Pastel  # Paleta de cores diferente
+        # Configurações otimizadas para PDF
+        fig_pie_receitas.update_layout(dict(
+            title='Distribuição de Receitas (Top 5)',
+            height=400,
+            width=500,
+            margin=dict(l=20, r=20, t=50, b=20),
+            font=dict(size=10),
+            showlegend=True,
+            legend=dict(
+                font=dict(size=9),
+                orientation="v",
+                yanchor="middle",
+                y=0.5,
+                xanchor="right",
+                x=1.3
             )
-            
-            # Configurações otimizadas para PDF
-            fig_pie_despesas.update_layout(
-                height=400,
-                width=500,
-                margin=dict(l=20, r=20, t=50, b=20),
-                font=dict(size=10),
-                showlegend=True,
-                legend=dict(
-                    font=dict(size=9),
-                    orientation="v",
-                    yanchor="middle",
-                    y=0.5,
-                    xanchor="right",
-                    x=1.3
-                )
+        ))
+        
+        imagens['pie_receitas'] = fig_pie_receitas.to_image(format='png', width=500, height=400, scale=1)
+    
+    if not top_despesas.empty:
+        fig_pie_despesas = go.Figure(go.Pie(
+            labels=top_despesas.index.to_numpy(),
+            values=top_despesas.to_numpy(),
+            textposition='inside',
+            textinfo='percent+label',
+            insidetextorientation='radial',
+            marker=dict(
+                colors=px.colors.qualitative.Pastel,  # Paleta de cores diferente
+                line=dict(color='white', width=1)
             )
-            
-            # Atualizar o traço (bordas) das fatias
-            fig_pie_despesas.update_traces(
-                textposition='inside',
-                textinfo='percent+label',
-                insidetextorientation='radial',
-                marker=dict(line=dict(color='white', width=1))
+        ))
+        
+        # Configurações otimizadas para PDF
+        fig_pie_despesas.update_layout(dict(
+            title='Distribuição de Despesas (Top 5)',
+            height=400,
+            width=500,
+            margin=dict(l=20, r=20, t=50, b=20),
+            font=dict(size=10),
+            showlegend=True,
+            legend=dict(
+                font=dict(size=9),
+                orientation="v",
+                yanchor="middle",
+                y=0.5,
+                xanchor="right",
+                x=1.3
             )
-            
-            img_path_pie_despesas = os.path.join(temp_dir, "pie_despesas.png")
-            fig_pie_despesas.write_image(img_path_pie_despesas, width=500, height=400, scale=1)
-            imagens['pie_despesas'] = img_path_pie_despesas
-            
+        ))
+        
+        imagens['pie_despesas'] = fig_pie_despesas.to_image(format='png', width=500, height=400, scale=1)
+    
+    return imagens
+
+def criar_grafico_topo_subcategorias(kpis_basicos):
+    """Cria gráficos de top subcategorias e retorna as imagens PNG em memória"""
+    imagens = {}
+    
+    try:
+        # Top 10 já vem ordenado: o top 5 é só um recorte, sem nova ordenação
+        # (serve tanto para as barras quanto para as pizzas)
+        imagens = _renderizar_graficos_pdf(
+            kpis_basicos['top_subcategorias_receita'].iloc[:5],
+            kpis_basicos['top_subcategorias_despesa'].iloc[:5]
+        )
     except Exception as e:
         # Não mostrar erro para o usuário - falha silenciosa
         pass
     
     return imagens
 
-def gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_name, temp_dir):
-    """Gera relatório PDF completo"""
+def gerar_relatorio_pdf(periodo, kpis_basicos, kpis_avancados, tendencias, company_name, gerado_em=None):
+    """Gera relatório PDF completo e retorna seus bytes"""
     pdf = PDFReport()
+    pdf.gerado_em = gerado_em
     pdf.add_page()
     
     # Capa com nome da empresa
@@ -507,10 +566,10 @@ def gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_na
     pdf.ln(20)
     
     # Período analisado
-    if 'Data' in df.columns:
-        periodo = f"Periodo: {df['Data'].min().strftime('%d/%m/%Y')} a {df['Data'].max().strftime('%d/%m/%Y')}"
+    if periodo:
+        data_inicial, data_final = periodo
         pdf.set_font('Arial', '', 12)
-        pdf.cell(0, 10, periodo, 0, 1, 'C')
+        pdf.cell(0, 10, f"Periodo: {data_inicial.strftime('%d/%m/%Y')} a {data_final.strftime('%d/%m/%Y')}", 0, 1, 'C')
     
     pdf.add_page()
     
@@ -545,24 +604,11 @@ def gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_na
     pdf.chapter_title('3. ANALISE DE TENDENCIAS')
     
     if tendencias:
-        # Traduzir o dia da semana se estiver em inglês
-        dia_maior_movimento = tendencias.get('dia_maior_movimento', 'N/A')
-        dias_traduzidos = {
-            'Monday': 'Segunda-feira',
-            'Tuesday': 'Terça-feira', 
-            'Wednesday': 'Quarta-feira',
-            'Thursday': 'Quinta-feira',
-            'Friday': 'Sexta-feira',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
-        dia_maior_movimento_traduzido = dias_traduzidos.get(dia_maior_movimento, dia_maior_movimento)
-        
         tendencias_text = f"""
         Crescimento Medio Mensal: {tendencias.get('crescimento_medio', 0):.1f}%
         Ultimo Crescimento: {tendencias.get('ultimo_crescimento', 0):.1f}%
         Tendencia Atual: {'POSITIVA' if tendencias.get('tendencia_positiva') else 'NEGATIVA'}
-        Dia de Maior Movimento: {dia_maior_movimento_traduzido}
+        Dia de Maior Movimento: {tendencias.get('dia_maior_movimento', 'N/A')}
         Meses Analisados: {tendencias.get('num_meses_analisados', 0)}
         """
     else:
@@ -576,7 +622,7 @@ def gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_na
         pdf.chapter_title('4. GRAFICOS E VISUALIZACOES')
         
         # Criar gráficos
-        imagens = criar_grafico_topo_subcategorias(kpis_basicos, temp_dir)
+        imagens = criar_grafico_topo_subcategorias(kpis_basicos)
         
         # Adicionar gráficos ao PDF com tamanhos otimizados
         if imagens:
@@ -584,13 +630,13 @@ def gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_na
                 pdf.set_font('Arial', 'B', 12)
                 pdf.cell(0, 10, 'Principais Fontes de Receita:', 0, 1)
                 # Gráfico menor para caber na página com legendas
-                pdf.image(imagens['top_receitas'], x=10, w=190)
+                pdf.image(io.BytesIO(imagens['top_receitas']), x=10, w=190)
                 pdf.ln(10)
             
             if 'top_despesas' in imagens:
                 pdf.set_font('Arial', 'B', 12)
                 pdf.cell(0, 10, 'Maiores Gastos:', 0, 1)
-                pdf.image(imagens['top_despesas'], x=10, w=190)
+                pdf.image(io.BytesIO(imagens['top_despesas']), x=10, w=190)
                 pdf.ln(10)
             
             # Nova página para os gráficos de pizza
@@ -601,13 +647,13 @@ def gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_na
                 pdf.set_font('Arial', 'B', 12)
                 pdf.cell(0, 10, 'Distribuicao de Receitas:', 0, 1)
                 # Gráficos de pizza centralizados e menores
-                pdf.image(imagens['pie_receitas'], x=25, w=160)
+                pdf.image(io.BytesIO(imagens['pie_receitas']), x=25, w=160)
                 pdf.ln(10)
             
             if 'pie_despesas' in imagens:
                 pdf.set_font('Arial', 'B', 12)
                 pdf.cell(0, 10, 'Distribuicao de Despesas:', 0, 1)
-                pdf.image(imagens['pie_despesas'], x=25, w=160)
+                pdf.image(io.BytesIO(imagens['pie_despesas']), x=25, w=160)
                 pdf.ln(10)
     
     # 5. ALERTAS E RECOMENDAÇÕES
@@ -618,20 +664,221 @@ def gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_na
     alertas_text = "\n".join([alerta["mensagem_sem_emoji"] for alerta in alertas])
     pdf.chapter_body(alertas_text)
     
-    # Salvar PDF
-    pdf_path = os.path.join(temp_dir, f"relatorio_financeiro_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf")
-    pdf.output(pdf_path)
+    # Gerar PDF em memória (fpdf2 devolve um bytearray)
+    return bytes(pdf.output())
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _pdf_bytes(chave_dados, chave_filtros, company_name, gerado_em, periodo, _kpis_basicos, _kpis_avancados, _tendencias):
+    """Relatório PDF com cache pelo arquivo, filtros, empresa e minuto de geração (os KPIs derivam dessas chaves)"""
+    return gerar_relatorio_pdf(periodo, _kpis_basicos, _kpis_avancados, _tendencias, company_name, gerado_em)
+
+def criar_botao_download_pdf(pdf_bytes, nome_arquivo):
+    """Cria botão de download para o PDF gerado em memória"""
+    st.download_button(
+        "📄 Clique aqui para baixar o PDF",
+        data=pdf_bytes,
+        file_name=nome_arquivo,
+        mime="application/pdf"
+    )
+
+@st.cache_data(show_spinner=False)
+def _fig_top_subcategorias(top, titulo, escala_cores):
+    """Gráfico de barras horizontais das principais subcategorias (cache pelos dados)"""
+    valores = top.to_numpy()
+    fig = go.Figure(go.Bar(
+        x=valores,
+        y=top.index.to_numpy(),
+        orientation='h',
+        marker=dict(color=valores, colorscale=escala_cores, showscale=True, colorbar=dict(title='Valor'))
+    ))
+    fig.update_layout(**COMMON_LAYOUT, title=titulo, xaxis_title='Valor', yaxis_title='Subcategoria')
+    return fig
+
+@st.cache_data(show_spinner=False)
+def _fig_evolucao_mensal(evolucao_mensal):
+    """Gráfico de barras agrupadas de receitas vs despesas por mês (cache pelos dados)"""
+    meses = evolucao_mensal.index.to_numpy()
+    fig = go.Figure([
+        go.Bar(name=str(tipo), x=meses, y=evolucao_mensal[tipo].to_numpy(), marker_color=CORES_TIPO.get(tipo))
+        for tipo in evolucao_mensal.columns
+    ])
+    fig.update_layout(**COMMON_LAYOUT, title='Evolução Mensal - Receitas vs Despesas', barmode='group',
+                      xaxis_title='Mês', yaxis_title='Valor', legend_title_text='Tipo')
+    return fig
+
+@st.cache_data(show_spinner=False)
+def _fig_linha_mensal(mensal, titulo, cor=None):
+    """Gráfico de linha da evolução mensal de um tipo de transação (cache pelos dados)"""
+    fig = go.Figure(go.Scatter(
+        x=mensal.index.to_numpy(),
+        y=mensal.to_numpy(),
+        mode='lines+markers',
+        line=dict(color=cor) if cor else None
+    ))
+    fig.update_layout(**COMMON_LAYOUT, title=titulo, xaxis_title='Mês', yaxis_title='Valor')
+    return fig
+
+@st.cache_data(show_spinner=False)
+def _fig_dias_semana(movimento_diario):
+    """Gráfico de barras do movimento por dia da semana (cache pelos dados)"""
+    valores = movimento_diario.to_numpy()
+    fig = go.Figure(go.Bar(
+        x=movimento_diario.index.to_numpy(),
+        y=valores,
+        marker=dict(color=valores, colorscale='Blues', showscale=True, colorbar=dict(title='Valor'))
+    ))
+    fig.update_layout(**COMMON_LAYOUT, title='Movimento Financeiro por Dia da Semana', xaxis_title='Dia da Semana', yaxis_title='Valor')
+    return fig
+
+@st.cache_data(show_spinner=False)
+def _fig_pizza_subcategorias(top, titulo):
+    """Gráfico de pizza da distribuição por subcategoria (cache pelos dados)"""
+    fig = go.Figure(go.Pie(labels=top.index.to_numpy(), values=top.to_numpy()))
+    fig.update_layout(**COMMON_LAYOUT, title=titulo)
+    return fig
+
+def _exibir_grafico(fig):
+    """Exibe um gráfico dos construtores acima com a configuração comum"""
+    st.plotly_chart(fig, width='stretch', config=PLOTLY_CFG)
+
+def _secao_gargalos(kpis_basicos, flags):
+    """Seção 4: principais receitas e despesas por subcategoria"""
+    # ========== SECTION 4: ANÁLISE DE GARGALOS ==========
+    st.markdown(SECTION_HEADERS['gargalos'], unsafe_allow_html=True)
+    
+    if not (flags['rec_sub'] or flags['des_sub']):
+        st.info("Nenhuma receita ou despesa encontrada")
+        return
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("💰 TOP RECEITAS")
+        if flags['rec_sub']:
+            fig_receitas = _fig_top_subcategorias(
+                kpis_basicos['top_subcategorias_receita'].round(2),
+                'Principais Fontes de Receita',
+                'Viridis'
+            )
+            _exibir_grafico(fig_receitas)
+        else:
+            st.info("Nenhuma receita encontrada")
     
-    return pdf_path
+    with col2:
+        st.subheader("💸 TOP DESPESAS")
+        if flags['des_sub']:
+            fig_despesas = _fig_top_subcategorias(
+                kpis_basicos['top_subcategorias_despesa'].round(2),
+                'Maiores Gastos',
+                'Reds'
+            )
+            _exibir_grafico(fig_despesas)
+        else:
+            st.info("Nenhuma despesa encontrada")
+
+def _secao_evolucao_temporal(agregacoes, flags):
+    """Seção 5: evolução mensal de receitas vs despesas"""
+    # ========== SECTION 5: EVOLUÇÃO TEMPORAL ==========
+    st.markdown(SECTION_HEADERS['evolucao'], unsafe_allow_html=True)
+    
+    if flags['evol']:
+        fig_evolucao = _fig_evolucao_mensal(agregacoes['evolucao_mensal'])
+        _exibir_grafico(fig_evolucao)
+
+def _secao_sazonalidade(agregacoes, flags):
+    """Seção 6: receitas/despesas mensais e movimento por dia da semana"""
+    # ========== SECTION 6: ANÁLISE DE SAZONALIDADE ==========
+    st.markdown(SECTION_HEADERS['sazonalidade'], unsafe_allow_html=True)
+    
+    # Análise por mês
+    if flags['rec_mens'] or flags['des_mens']:
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("📊 Receitas Mensais")
+            if flags['rec_mens']:
+                fig_receitas_mensais = _fig_linha_mensal(agregacoes['receitas_mensais'], 'Evolução das Receitas Mensais')
+                _exibir_grafico(fig_receitas_mensais)
+        
+        with col2:
+            st.subheader("📊 Despesas Mensais")
+            if flags['des_mens']:
+                fig_despesas_mensais = _fig_linha_mensal(agregacoes['despesas_mensais'], 'Evolução das Despesas Mensais', 'red')
+                _exibir_grafico(fig_despesas_mensais)
+    else:
+        st.info("Nenhuma receita ou despesa mensal encontrada")
+    
+    # Análise por dia da semana - CORRIGIDO para português
+    st.subheader("📅 Movimento por Dia da Semana")
+    movimento_diario = agregacoes['movimento_diario']
+    
+    fig_dias = _fig_dias_semana(movimento_diario)
+    _exibir_grafico(fig_dias)
 
-def criar_link_download_pdf(pdf_path, nome_arquivo):
-    """Cria link de download para o PDF"""
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
+def _secao_subcategorias(kpis_basicos, flags):
+    """Seção 7: distribuição de receitas e despesas por subcategoria"""
+    # ========== SECTION 7: DISTRIBUIÇÃO POR SUBCATEGORIA ==========
+    st.markdown(SECTION_HEADERS['subcategorias'], unsafe_allow_html=True)
+    
+    if not (flags['rec_sub'] or flags['des_sub']):
+        st.info("Nenhuma receita ou despesa encontrada por subcategoria")
+        return
+    
+    col1, col2 = st.columns(2)
     
-    b64_pdf = base64.b64encode(pdf_bytes).decode()
-    href = f'<a href="data:application/octet-stream;base64,{b64_pdf}" download="{nome_arquivo}">📄 Clique aqui para baixar o PDF</a>'
-    return href
+    with col1:
+        st.subheader("💰 Receitas por Subcategoria")
+        if flags['rec_sub']:
+            # Top 10 já calculado nos KPIs (mesma fatia da análise de gargalos)
+            top_receitas = kpis_basicos['top_subcategorias_receita'].round(2)
+            fig_receitas_sub = _fig_pizza_subcategorias(top_receitas, 'Distribuição de Receitas por Subcategoria (Top 10)')
+            _exibir_grafico(fig_receitas_sub)
+        else:
+            st.info("Nenhuma receita encontrada por subcategoria")
+    
+    with col2:
+        st.subheader("💸 Despesas por Subcategoria")
+        if flags['des_sub']:
+            # Top 10 já calculado nos KPIs (mesma fatia da análise de gargalos)
+            top_despesas = kpis_basicos['top_subcategorias_despesa'].round(2)
+            fig_despesas_sub = _fig_pizza_subcategorias(top_despesas, 'Distribuição de Despesas por Subcategoria (Top 10)')
+            _exibir_grafico(fig_despesas_sub)
+        else:
+            st.info("Nenhuma despesa encontrada por subcategoria")
+
+# Fragmento: gerar o PDF reexecuta só esta seção, com os KPIs recebidos na
+# última execução completa; o formulário segura o nome da empresa até o envio
+@st.fragment
+def _secao_exportar(chave_dados, chave_filtros, periodo, kpis_basicos, kpis_avancados, tendencias):
+    """Seção 8: nome da empresa e geração do relatório PDF"""
+    # ========== SECTION 8: DOWNLOAD DO RELATÓRIO ==========
+    st.markdown(SECTION_HEADERS['exportar'], unsafe_allow_html=True)
+    
+    # Solicitar nome da empresa (digitar não dispara reexecução, só o envio)
+    with st.form('pdf_form'):
+        company_name = st.text_input(
+            "🏢 Nome da Empresa",
+            placeholder="Digite o nome da sua empresa",
+            help="Este nome será exibido no relatório PDF"
+        )
+        enviado = st.form_submit_button("📄 GERAR RELATÓRIO COMPLETO (PDF)", type="primary", width='stretch')
+    
+    # O botão de download não pode ficar dentro do formulário
+    if enviado and not company_name:
+        st.warning("⚠️ Por favor, digite o nome da empresa para gerar o relatório PDF.")
+    elif enviado:
+        with st.spinner("Gerando relatório PDF..."):
+            try:
+                # Minuto de geração compartilhado pela capa e pelo nome do arquivo
+                gerado_em = datetime.now().replace(second=0, microsecond=0)
+                pdf_bytes = _pdf_bytes(chave_dados, chave_filtros, company_name, gerado_em, periodo, kpis_basicos, kpis_avancados, tendencias)
+                nome_arquivo = f"relatorio_financeiro_{company_name.replace(' ', '_')}_{gerado_em.strftime('%Y%m%d_%H%M')}.pdf"
+                
+                criar_botao_download_pdf(pdf_bytes, nome_arquivo)
+                st.success("✅ Relatório PDF gerado com sucesso!")
+                
+            except Exception as e:
+                st.error(f"❌ Erro ao gerar PDF: {str(e)}")
 
 def main():
     st.markdown('<h1 class="main-header">📊 DASHBOARD FINANCEIRO PROFISSIONAL</h1>', unsafe_allow_html=True)
@@ -644,21 +891,17 @@ def main():
         help="Arquivo CSV com colunas: Data, Categoria, Subcategoria, Tipo, Cliente, Valor"
     )
     
-    # Solicitar nome da empresa
-    st.sidebar.header("🏢 INFORMACOES DA EMPRESA")
-    company_name = st.sidebar.text_input(
-        "Nome da Empresa",
-        placeholder="Digite o nome da sua empresa",
-        help="Este nome será exibido no relatório PDF"
-    )
-    
     if uploaded_file is not None:
         try:
             # Carregar dados
-            df = carregar_dados(uploaded_file)
+            # (o DataFrame já tipado fica em memória pelo SHA-256 do arquivo, sem gravar os dados em disco)
+            conteudo = uploaded_file.getvalue()
+            chave_dados = hashlib.sha256(conteudo).hexdigest()
+            df = carregar_dados(conteudo, chave_dados)
             
             # Filtros na sidebar
             st.sidebar.header("🔍 FILTROS")
+            estado_filtros = []
             
             # Filtro por período - FORMATO BRASILEIRO
             if 'Data' in df.columns:
@@ -675,42 +918,68 @@ def main():
                 
                 if len(date_range) == 2:
                     start_date, end_date = date_range
-                    df = df[(df['Data'].dt.date >= start_date) & (df['Data'].dt.date <= end_date)]
+                    estado_filtros.append((start_date, end_date))
+                    # Limites como datetime64 (fim exclusivo no dia seguinte) para comparar direto os timestamps
+                    inicio = np.datetime64(start_date)
+                    fim = np.datetime64(end_date) + np.timedelta64(1, 'D')
+                    datas = df['Data'].to_numpy()
+                    df = df[(datas >= inicio) & (datas < fim)]
             
             # Filtro por tipo
             if 'Tipo' in df.columns:
+                opcoes = _opcoes_filtro(df['Tipo'])
                 tipos = st.sidebar.multiselect(
                     "Tipo de Transação",
-                    options=df['Tipo'].unique(),
-                    default=df['Tipo'].unique()
+                    options=opcoes,
+                    default=opcoes
                 )
-                df = df[df['Tipo'].isin(tipos)]
+                # Seleção completa (padrão) não filtra: mantém também as linhas sem tipo
+                if len(tipos) < len(opcoes):
+                    df = df[df['Tipo'].isin(tipos)]
+                estado_filtros.append(tuple(sorted(tipos)))
             
             # Filtro por categoria
             if 'Categoria' in df.columns:
+                opcoes = _opcoes_filtro(df['Categoria'])
                 categorias = st.sidebar.multiselect(
                     "Categorias",
-                    options=df['Categoria'].unique(),
-                    default=df['Categoria'].unique()
+                    options=opcoes,
+                    default=opcoes
                 )
-                df = df[df['Categoria'].isin(categorias)]
+                # Seleção completa (padrão) não filtra: mantém também as linhas sem categoria
+                if len(categorias) < len(opcoes):
+                    df = df[df['Categoria'].isin(categorias)]
+                estado_filtros.append(tuple(sorted(categorias)))
             
             # Filtro por subcategoria
             if 'Subcategoria' in df.columns:
+                opcoes = _opcoes_filtro(df['Subcategoria'])
                 subcategorias = st.sidebar.multiselect(
                     "Subcategorias",
-                    options=df['Subcategoria'].unique(),
-                    default=df['Subcategoria'].unique()
+                    options=opcoes,
+                    default=opcoes
                 )
-                df = df[df['Subcategoria'].isin(subcategorias)]
+                # Seleção completa (padrão) não filtra: mantém também as linhas sem subcategoria
+                if len(subcategorias) < len(opcoes):
+                    df = df[df['Subcategoria'].isin(subcategorias)]
+                estado_filtros.append(tuple(sorted(subcategorias)))
             
-            # Calcular KPIs
-            kpis_basicos = calcular_kpis_basicos(df)
-            kpis_avancados = calcular_kpis_avancados_melhorado(df, kpis_basicos)
-            tendencias = analisar_tendencias(df)
+            # Calcular KPIs e agregações (memorizados por arquivo + estado dos filtros)
+            chave_filtros = tuple(estado_filtros)
+            kpis_basicos, kpis_avancados, tendencias, alertas = calcular_indicadores(df, chave_dados, chave_filtros)
+            agregacoes = calcular_agregacoes_temporais(df, chave_dados, chave_filtros)
+            
+            # Quais blocos têm dados (verificado uma vez e reaproveitado nas seções)
+            flags = {
+                'rec_sub': not kpis_basicos['receitas_por_subcategoria'].empty,
+                'des_sub': not kpis_basicos['despesas_por_subcategoria'].empty,
+                'evol': not agregacoes['evolucao_mensal'].empty,
+                'rec_mens': not agregacoes['receitas_mensais'].empty,
+                'des_mens': not agregacoes['despesas_mensais'].empty
+            }
             
             # ========== SECTION 1: KPIs PRINCIPAIS ==========
-            st.markdown('<div class="section-header">📈 KPIs FINANCEIROS PRINCIPAIS</div>', unsafe_allow_html=True)
+            st.markdown(SECTION_HEADERS['kpis'], unsafe_allow_html=True)
             
             col1, col2, col3, col4 = st.columns(4)
             
@@ -737,232 +1006,30 @@ def main():
                 st.metric("🎫 TICKET MÉDIO", f"R$ {kpis_basicos['ticket_medio']:,.2f}")
             
             # ========== SECTION 2: KPIs FINANCEIROS AVANÇADOS ==========
-            st.markdown('<div class="section-header">🎯 KPIs FINANCEIROS AVANÇADOS</div>', unsafe_allow_html=True)
-            
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.markdown(f"""
-                <div class="advanced-kpi">
-                    <h3>📈 ROI</h3>
-                    <h2>{kpis_avancados['roi']:.1f}%</h2>
-                    <small>Return on Investment</small>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col2:
-                st.markdown(f"""
-                <div class="advanced-kpi">
-                    <h3>⚖️ PONTO DE EQUILÍBRIO</h3>
-                    <h2>R$ {kpis_avancados['ponto_equilibrio']:,.2f}</h2>
-                    <small>Break-even Point</small>
-                </div>
-                """, unsafe_allow_html=True)
+            st.markdown(SECTION_HEADERS['avancados'], unsafe_allow_html=True)
             
-            with col3:
-                st.markdown(f"""
-                <div class="advanced-kpi">
-                    <h3>💼 FLUXO DE CAIXA</h3>
-                    <h2>R$ {kpis_avancados['fluxo_caixa_operacional']:,.2f}</h2>
-                    <small>Operational Cash Flow</small>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col4:
-                st.markdown(f"""
-                <div class="advanced-kpi">
-                    <h3>🔄 CICLO DE CAIXA</h3>
-                    <h2>{kpis_avancados['ciclo_conversao_caixa']} dias</h2>
-                    <small>Cash Conversion Cycle</small>
-                </div>
-                """, unsafe_allow_html=True)
+            for coluna, card in zip(st.columns(4), KPI_CARDS_AVANCADOS):
+                with coluna:
+                    st.markdown(card.format_map(kpis_avancados), unsafe_allow_html=True)
             
             # Margem de Contribuição
-            st.markdown(f"""
-            <div class="advanced-kpi">
-                <h3>📊 MARGEM DE CONTRIBUIÇÃO</h3>
-                <h2>{kpis_avancados['margem_contribuicao']:.1f}%</h2>
-                <small>Contribuição Marginal</small>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(KPI_CARD_MARGEM.format_map(kpis_avancados), unsafe_allow_html=True)
             
             # ========== SECTION 3: ALERTAS E RECOMENDAÇÕES ==========
-            st.markdown('<div class="section-header">⚠️ ALERTAS E RECOMENDAÇÕES</div>', unsafe_allow_html=True)
-            
-            alertas = gerar_alertas(kpis_basicos, kpis_avancados, tendencias)
-            
-            for alerta in alertas:
-                if alerta["tipo"] == "critical":
-                    st.markdown(f'<div class="alert-critical">{alerta["mensagem"]}</div>', unsafe_allow_html=True)
-                elif alerta["tipo"] == "warning":
-                    st.markdown(f'<div class="alert-warning">{alerta["mensagem"]}</div>', unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="alert-success">{alerta["mensagem"]}</div>', unsafe_allow_html=True)
-            
-            # ========== SECTION 4: ANÁLISE DE GARGALOS ==========
-            st.markdown('<div class="section-header">🔍 ANÁLISE DE GARGALOS</div>', unsafe_allow_html=True)
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("💰 TOP RECEITAS")
-                if not kpis_basicos['top_subcategorias_receita'].empty:
-                    fig_receitas = px.bar(
-                        kpis_basicos['top_subcategorias_receita'].reset_index(),
-                        x='Valor',
-                        y='Subcategoria',
-                        orientation='h',
-                        color='Valor',
-                        color_continuous_scale='Viridis',
-                        title='Principais Fontes de Receita'
-                    )
-                    fig_receitas.update_layout(height=400)
-                    st.plotly_chart(fig_receitas, use_container_width=True)
-                else:
-                    st.info("Nenhuma receita encontrada")
-            
-            with col2:
-                st.subheader("💸 TOP DESPESAS")
-                if not kpis_basicos['top_subcategorias_despesa'].empty:
-                    fig_despesas = px.bar(
-                        kpis_basicos['top_subcategorias_despesa'].reset_index(),
-                        x='Valor',
-                        y='Subcategoria',
-                        orientation='h',
-                        color='Valor',
-                        color_continuous_scale='Reds',
-                        title='Maiores Gastos'
-                    )
-                    fig_despesas.update_layout(height=400)
-                    st.plotly_chart(fig_despesas, use_container_width=True)
-                else:
-                    st.info("Nenhuma despesa encontrada")
-            
-            # ========== SECTION 5: EVOLUÇÃO TEMPORAL ==========
-            st.markdown('<div class="section-header">📈 EVOLUÇÃO TEMPORAL</div>', unsafe_allow_html=True)
-            
-            if 'Mês' in df.columns:
-                evolucao_mensal = df.groupby(['Mês', 'Tipo'])['Valor'].sum().reset_index()
-                
-                if not evolucao_mensal.empty:
-                    fig_evolucao = px.bar(
-                        evolucao_mensal,
-                        x='Mês',
-                        y='Valor',
-                        color='Tipo',
-                        title='Evolução Mensal - Receitas vs Despesas',
-                        barmode='group',
-                        color_discrete_map={'Receita': '#2ecc71', 'Despesa': '#e74c3c'}
-                    )
-                    fig_evolucao.update_layout(height=400)
-                    st.plotly_chart(fig_evolucao, use_container_width=True)
-            
-            # ========== SECTION 6: ANÁLISE DE SAZONALIDADE ==========
-            st.markdown('<div class="section-header">📅 ANÁLISE DE SAZONALIDADE</div>', unsafe_allow_html=True)
-            
-            if 'Mês' in df.columns:
-                # Análise por mês
-                receitas_mensais = df[df['Tipo'] == 'Receita'].groupby('Mês')['Valor'].sum()
-                despesas_mensais = df[df['Tipo'] == 'Despesa'].groupby('Mês')['Valor'].sum()
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.subheader("📊 Receitas Mensais")
-                    if not receitas_mensais.empty:
-                        fig_receitas_mensais = px.line(
-                            receitas_mensais.reset_index(),
-                            x='Mês',
-                            y='Valor',
-                            title='Evolução das Receitas Mensais',
-                            markers=True
-                        )
-                        st.plotly_chart(fig_receitas_mensais, use_container_width=True)
-                
-                with col2:
-                    st.subheader("📊 Despesas Mensais")
-                    if not despesas_mensais.empty:
-                        fig_despesas_mensais = px.line(
-                            despesas_mensais.reset_index(),
-                            x='Mês',
-                            y='Valor',
-                            title='Evolução das Despesas Mensais',
-                            markers=True,
-                            color_discrete_sequence=['red']
-                        )
-                        st.plotly_chart(fig_despesas_mensais, use_container_width=True)
-                
-                # Análise por dia da semana - CORRIGIDO para português
-                if 'Dia da Semana' in df.columns:
-                    st.subheader("📅 Movimento por Dia da Semana")
-                    # Ordem correta dos dias da semana em português
-                    ordem_dias = ['Segunda-feira', 'Terça-feira', 'Quarta-feira', 'Quinta-feira', 'Sexta-feira', 'Sábado', 'Domingo']
-                    movimento_diario = df.groupby('Dia da Semana')['Valor'].sum().reindex(ordem_dias, fill_value=0)
-                    
-                    fig_dias = px.bar(
-                        movimento_diario.reset_index(),
-                        x='Dia da Semana',
-                        y='Valor',
-                        title='Movimento Financeiro por Dia da Semana',
-                        color='Valor',
-                        color_continuous_scale='Blues'
-                    )
-                    st.plotly_chart(fig_dias, use_container_width=True)
+            st.markdown(SECTION_HEADERS['alertas'], unsafe_allow_html=True)
             
-            # ========== SECTION 7: DISTRIBUIÇÃO POR SUBCATEGORIA ==========
-            st.markdown('<div class="section-header">📊 DISTRIBUIÇÃO POR SUBCATEGORIA</div>', unsafe_allow_html=True)
+            # Todos os alertas num único bloco HTML (uma só mensagem para o frontend)
+            st.markdown(''.join(_ALERT_TMPL[alerta["tipo"]].format(alerta["mensagem"]) for alerta in alertas), unsafe_allow_html=True)
             
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("💰 Receitas por Subcategoria")
-                if not kpis_basicos['receitas_por_subcategoria'].empty:
-                    # Limitar para mostrar apenas as top 10 subcategorias para melhor visualização
-                    top_receitas = kpis_basicos['receitas_por_subcategoria'].nlargest(10)
-                    fig_receitas_sub = px.pie(
-                        top_receitas.reset_index(),
-                        values='Valor',
-                        names='Subcategoria',
-                        title='Distribuição de Receitas por Subcategoria (Top 10)'
-                    )
-                    st.plotly_chart(fig_receitas_sub, use_container_width=True)
-                else:
-                    st.info("Nenhuma receita encontrada por subcategoria")
-            
-            with col2:
-                st.subheader("💸 Despesas por Subcategoria")
-                if not kpis_basicos['despesas_por_subcategoria'].empty:
-                    # Limitar para mostrar apenas as top 10 subcategorias para melhor visualização
-                    top_despesas = kpis_basicos['despesas_por_subcategoria'].nlargest(10)
-                    fig_despesas_sub = px.pie(
-                        top_despesas.reset_index(),
-                        values='Valor',
-                        names='Subcategoria',
-                        title='Distribuição de Despesas por Subcategoria (Top 10)'
-                    )
-                    st.plotly_chart(fig_despesas_sub, use_container_width=True)
-                else:
-                    st.info("Nenhuma despesa encontrada por subcategoria")
+            # ========== SECTIONS 4-7: GRÁFICOS ==========
+            _secao_gargalos(kpis_basicos, flags)
+            _secao_evolucao_temporal(agregacoes, flags)
+            _secao_sazonalidade(agregacoes, flags)
+            _secao_subcategorias(kpis_basicos, flags)
             
             # ========== SECTION 8: DOWNLOAD DO RELATÓRIO ==========
-            st.markdown('<div class="section-header">💾 EXPORTAR RELATÓRIO</div>', unsafe_allow_html=True)
-            
-            if not company_name:
-                st.warning("⚠️ Por favor, digite o nome da empresa na barra lateral para gerar o relatório PDF.")
-            
-            if st.button("📄 GERAR RELATÓRIO COMPLETO (PDF)", type="primary", use_container_width=True, disabled=not company_name):
-                with st.spinner("Gerando relatório PDF..."):
-                    with tempfile.TemporaryDirectory() as temp_dir:
-                        try:
-                            pdf_path = gerar_relatorio_pdf(df, kpis_basicos, kpis_avancados, tendencias, company_name, temp_dir)
-                            nome_arquivo = f"relatorio_financeiro_{company_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-                            
-                            href = criar_link_download_pdf(pdf_path, nome_arquivo)
-                            st.markdown(href, unsafe_allow_html=True)
-                            st.success("✅ Relatório PDF gerado com sucesso!")
-                            
-                        except Exception as e:
-                            st.error(f"❌ Erro ao gerar PDF: {str(e)}")
+            periodo = (df['Data'].min(), df['Data'].max()) if not df.empty else None
+            _secao_exportar(chave_dados, chave_filtros, periodo, kpis_basicos, kpis_avancados, tendencias)
         
         except Exception as e:
             st.error(f"❌ Erro ao processar o arquivo: {str(e)}")